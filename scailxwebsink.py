@@ -9,6 +9,9 @@ class ScailxWebSink(Gst.Bin):
                       "autovideosink target for sending h264 to webrtc client",
                       "Kobus Goosen")
 
+    # Settings applied to the internal vpuenc_h264 encoder
+    ENCODER_PROPERTIES = {'qp-max': 30, 'qp-min': 18}
+
     __gproperties__ = {
         'ts-offset': (int,                # type
                      'Timestamp offset',   # nick
@@ -18,27 +21,46 @@ class ScailxWebSink(Gst.Bin):
                      )
     }
 
+    # Maps property names to the attributes holding their values
+    _PROP_MAP = {'ts-offset': 'ts_offset'}
+
     def __init__(self):
         self.ts_offset = 0  # Initialize property value
+        self.sink = None
         Gst.Bin.__init__(self)
 
-        # Create the internal pipeline using parse_launch
-        pipeline_str = "imxvideoconvert_g2d ! vpuenc_h264 qp-max=30 qp-min=18 ! websink"
-        bin = Gst.parse_launch(pipeline_str)
+        # Create the internal elements directly in this bin
+        convert = Gst.ElementFactory.make('imxvideoconvert_g2d', 'convert')
+        encoder = Gst.ElementFactory.make('vpuenc_h264', 'encoder')
+        sink = Gst.ElementFactory.make('websink', 'sink')
+        if not convert or not encoder or not sink:
+            Gst.error("Failed to create internal elements")
+            return None
+
+        for name, value in self.ENCODER_PROPERTIES.items():
+            encoder.set_property(name, value)
+
+        # Kept to forward ts-offset to the websink, which applies it
+        self.sink = sink
 
-        # Get the sink pad of the first element and the source pad of the last element
-        first_element = bin.get_by_name("imxvideoconvert_g2d0")
-        if not first_element:
-            Gst.error("Failed to get first element")
+        self.add(convert, encoder, sink)
+        try:
+            Gst.Element.link_many(convert, encoder, sink)
+        except Gst.LinkError:
+            Gst.error("Failed to link internal elements")
             return None
 
-        self.add(bin)
         # Create sink pad
-        self.sink_pad = Gst.GhostPad.new('sink', first_element.get_static_pad('sink'))
+        self.sink_pad = Gst.GhostPad.new('sink', convert.get_static_pad('sink'))
         self.add_pad(self.sink_pad)
 
+    def do_get_property(self, prop):
+        return getattr(self, self._PROP_MAP[prop.name])
+
     def do_set_property(self, prop, value):
-        pass
+        setattr(self, self._PROP_MAP[prop.name], value)
+        if prop.name == 'ts-offset' and self.sink:
+            self.sink.set_property('ts-offset', value)
 
 # Register the GObject type
 GObject.type_register(ScailxWebSink)
@@ -75,3 +75,54 @@ fn test_websink_pipeline() {
     let errors = errors.lock().unwrap();
     assert!(errors.is_empty(), "Pipeline errors: {:?}", *errors);
 }
+
+#[test]
+fn test_websink_port_in_use() {
+    // Initialize GStreamer
+    gst::init().expect("Failed to initialize gst_init");
+
+    // Register the WebSink element with GStreamer
+    gst::Element::register(None, "websink", gst::Rank::NONE, WebSink::static_type()).unwrap();
+
+    let make_pipeline = || {
+        let pipeline = gst::Pipeline::new();
+        let sink = gst::ElementFactory::make("websink")
+            .property("port", 8095u32)
+            .build()
+            .expect("Failed to create websink");
+        pipeline.add(&sink).unwrap();
+        pipeline
+    };
+
+    // The first sink binds the port; without a source it simply waits for preroll
+    let first = make_pipeline();
+    first
+        .set_state(gst::State::Paused)
+        .expect("First websink should start");
+
+    // The second sink on the same port must fail its state change instead of panicking
+    let second = make_pipeline();
+    assert!(
+        second.set_state(gst::State::Paused).is_err(),
+        "Second websink on the same port should fail to start"
+    );
+
+    // The failure is reported on the bus as a resource error
+    let bus = second.bus().unwrap();
+    let msg = bus
+        .timed_pop_filtered(gst::ClockTime::from_seconds(1), &[gst::MessageType::Error])
+        .expect("Expected an error message for the port conflict");
+    match msg.view() {
+        gst::MessageView::Error(err) => {
+            assert!(
+                err.error().matches(gst::ResourceError::OpenReadWrite),
+                "Unexpected error: {}",
+                err.error()
+            );
+        }
+        _ => unreachable!(),
+    }
+
+    second.set_state(gst::State::Null).expect("Failed to set second pipeline to Null");
+    first.set_state(gst::State::Null).expect("Failed to set first pipeline to Null");
+}
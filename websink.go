@@ -24,6 +24,9 @@
 package main
 
 import (
+	"crypto/ecdsa"
+	"crypto/elliptic"
+	"crypto/rand"
 	"embed"
 	"encoding/json"
 	"fmt"
@@ -48,6 +51,10 @@ import (
 var (
 	DefaultPort       = 8091
 	DefaultStunServer = "stun:stun.l.google.com:19302"
+	// Sample duration used for buffers without one (30fps)
+	DefaultFrameDuration = time.Second / 30
+	// Renew the shared DTLS certificate when it is this close to expiry
+	CertificateRenewBefore = 24 * time.Hour
 	// print colors
 	GREEN = "\033[32m"
 	RED   = "\033[31m"
@@ -104,10 +111,17 @@ type state struct {
 	actualPort int
 	// The WebRTC configuration
 	webrtcConfig webrtc.Configuration
+	// The WebRTC API shared by all peer connections
+	api *webrtc.API
+	// DTLS certificate shared by peer connections, renewed before it expires
+	certificateMutex sync.Mutex
+	certificate      *webrtc.Certificate
 	// Map to store active peer connections
 	peerConnectionsMutex sync.RWMutex
 	peerConnections      map[string]*webrtc.PeerConnection
 	numPeers             atomic.Int32
+	// Counter used to generate unique peer IDs
+	lastPeerID atomic.Int64
 	// Channel to notify about peer connection changes
 	unblock chan int32
 	// Shared video track
@@ -152,17 +166,13 @@ func (w *WebSink) updatePeerConnections(id string, pc *webrtc.PeerConnection, ad
 	}
 }
 
-// findAvailablePort finds an available port starting from the given port
-func findAvailablePort(startPort int) (int, error) {
-	// If startPort is 0, find any available port
+// listenAvailablePort opens a TCP listener on the first available port starting
+// from the given port. The listener is handed to the HTTP server as-is, so the
+// port cannot be taken by someone else between probing and serving.
+func listenAvailablePort(startPort int) (net.Listener, error) {
+	// If startPort is 0, listen on any available port
 	if startPort == 0 {
-		listener, err := net.Listen("tcp", ":0")
-		if err != nil {
-			return 0, err
-		}
-		port := listener.Addr().(*net.TCPAddr).Port
-		listener.Close()
-		return port, nil
+		return net.Listen("tcp", ":0")
 	}
 
 	// Otherwise, try the specified port and increment if not available
@@ -173,13 +183,12 @@ func findAvailablePort(startPort int) (int, error) {
 		addr := fmt.Sprintf(":%d", port)
 		listener, err := net.Listen("tcp", addr)
 		if err == nil {
-			listener.Close()
-			return port, nil
+			return listener, nil
 		}
 		port++
 	}
 
-	return 0, fmt.Errorf("no available ports found between %d and %d", startPort, maxPort)
+	return nil, fmt.Errorf("no available ports found between %d and %d", startPort, maxPort)
 }
 
 // handleSession creates a handler for the /api/session endpoint
@@ -204,7 +213,7 @@ func (w *WebSink) handleSession(resp http.ResponseWriter, req *http.Request) {
 	}
 
 	// Generate a unique ID for this peer connection
-	peerID := fmt.Sprintf("peer-%d", len(w.state.peerConnections)+1)
+	peerID := fmt.Sprintf("peer-%d", w.state.lastPeerID.Add(1))
 
 	// Create a new peer connection for this client
 	peerConnection, err := w.createPeerConnection(peerID)
@@ -216,20 +225,25 @@ func (w *WebSink) handleSession(resp http.ResponseWriter, req *http.Request) {
 	// Add to the peer connections map
 	w.updatePeerConnections(peerID, peerConnection, true)
 
+	// Remove and close the peer connection if any step below fails
+	established := false
+	defer func() {
+		if !established {
+			w.updatePeerConnections(peerID, nil, false)
+			peerConnection.Close()
+		}
+	}()
+
 	// Decode the offer
 	offer := webrtc.SessionDescription{}
 	if err := json.Unmarshal(sessionReq.Offer, &offer); err != nil {
 		http.Error(resp, "Error parsing offer: "+err.Error(), http.StatusBadRequest)
-		// Remove from peer connections map if we fail
-		w.updatePeerConnections(peerID, nil, false)
 		return
 	}
 
 	// Set the remote SessionDescription
 	if err := peerConnection.SetRemoteDescription(offer); err != nil {
 		http.Error(resp, "Error setting remote description: "+err.Error(), http.StatusInternalServerError)
-		// Remove from peer connections map if we fail
-		w.updatePeerConnections(peerID, nil, false)
 		return
 	}
 
@@ -237,16 +251,12 @@ func (w *WebSink) handleSession(resp http.ResponseWriter, req *http.Request) {
 	answer, err := peerConnection.CreateAnswer(nil)
 	if err != nil {
 		http.Error(resp, "Error creating answer: "+err.Error(), http.StatusInternalServerError)
-		// Remove from peer connections map if we fail
-		w.updatePeerConnections(peerID, nil, false)
 		return
 	}
 
 	// Sets the LocalDescription, and starts our UDP listeners
 	if err = peerConnection.SetLocalDescription(answer); err != nil {
 		http.Error(resp, "Error setting local description: "+err.Error(), http.StatusInternalServerError)
-		// Remove from peer connections map if we fail
-		w.updatePeerConnections(peerID, nil, false)
 		return
 	}
 
@@ -258,11 +268,11 @@ func (w *WebSink) handleSession(resp http.ResponseWriter, req *http.Request) {
 	answerJSON, err := json.Marshal(peerConnection.LocalDescription())
 	if err != nil {
 		http.Error(resp, "Error encoding answer: "+err.Error(), http.StatusInternalServerError)
-		// Remove from peer connections map if we fail
-		w.updatePeerConnections(peerID, nil, false)
 		return
 	}
 
+	established = true
+
 	// Return the answer as JSON
 	resp.Header().Set("Content-Type", "application/json")
 	response := SessionResponse{
@@ -272,10 +282,41 @@ func (w *WebSink) handleSession(resp http.ResponseWriter, req *http.Request) {
 	json.NewEncoder(resp).Encode(response)
 }
 
+// dtlsCertificate returns the shared DTLS certificate, generating a new one when
+// there is none yet or the current one is close to expiry
+func (w *WebSink) dtlsCertificate() (*webrtc.Certificate, error) {
+	w.state.certificateMutex.Lock()
+	defer w.state.certificateMutex.Unlock()
+
+	if w.state.certificate != nil && time.Until(w.state.certificate.Expires()) > CertificateRenewBefore {
+		return w.state.certificate, nil
+	}
+
+	privateKey, err := ecdsa.GenerateKey(elliptic.P256(), rand.Reader)
+	if err != nil {
+		return nil, err
+	}
+	certificate, err := webrtc.GenerateCertificate(privateKey)
+	if err != nil {
+		return nil, err
+	}
+	w.state.certificate = certificate
+	CAT.Log(gst.LevelInfo, fmt.Sprintf("Generated DTLS certificate valid until %s", certificate.Expires()))
+	return certificate, nil
+}
+
 // createPeerConnection creates a new peer connection with the shared tracks
 func (w *WebSink) createPeerConnection(peerID string) (*webrtc.PeerConnection, error) {
 	// Create a new RTCPeerConnection
-	peerConnection, err := webrtc.NewPeerConnection(w.state.webrtcConfig)
+	// Use the shared DTLS certificate on a copy of the configuration
+	certificate, err := w.dtlsCertificate()
+	if err != nil {
+		return nil, err
+	}
+	config := w.state.webrtcConfig
+	config.Certificates = []webrtc.Certificate{*certificate}
+
+	peerConnection, err := w.state.api.NewPeerConnection(config)
 	if err != nil {
 		return nil, err
 	}
@@ -300,6 +341,7 @@ func (w *WebSink) createPeerConnection(peerID string) (*webrtc.PeerConnection, e
 	// Add the video track to the peer connection
 	_, err = peerConnection.AddTrack(w.state.videoTrack)
 	if err != nil {
+		peerConnection.Close()
 		return nil, err
 	}
 
@@ -308,12 +350,13 @@ func (w *WebSink) createPeerConnection(peerID string) (*webrtc.PeerConnection, e
 
 // startHTTPServer starts the HTTP server for the websink
 func (w *WebSink) startHTTPServer(self *base.GstBaseSink) bool {
-	// Find an available port
-	port, err := findAvailablePort(w.settings.port)
+	// Listen on an available port
+	listener, err := listenAvailablePort(w.settings.port)
 	if err != nil {
 		self.Log(CAT, gst.LevelError, "Could not find available port")
 		return false
 	}
+	port := listener.Addr().(*net.TCPAddr).Port
 	w.state.actualPort = port
 
 	// Set up HTTP handlers
@@ -327,9 +370,12 @@ func (w *WebSink) startHTTPServer(self *base.GstBaseSink) bool {
 	mux.Handle("GET /", fileserver)
 
 	// Create the HTTP server
+	// Keep-alive is on by default; bound how long idle connections are held
 	w.state.server = &http.Server{
-		Addr:    ":" + strconv.Itoa(port),
-		Handler: mux,
+		Addr:              ":" + strconv.Itoa(port),
+		Handler:           mux,
+		ReadHeaderTimeout: 10 * time.Second,
+		IdleTimeout:       75 * time.Second,
 	}
 
 	// Start the HTTP server in a goroutine
@@ -340,7 +386,7 @@ func (w *WebSink) startHTTPServer(self *base.GstBaseSink) bool {
 	portStr := strconv.Itoa(port)
 
 	go func() {
-		if err := w.state.server.ListenAndServe(); err != nil && err != http.ErrServerClosed {
+		if err := w.state.server.Serve(listener); err != nil && err != http.ErrServerClosed {
 			CAT.LogError("HTTP server error: " + err.Error())
 		}
 	}()
@@ -487,6 +533,10 @@ func (w *WebSink) Start(self *base.GstBaseSink) bool {
 		}
 	}
 
+	// Create the API once: webrtc.NewPeerConnection would register the default
+	// codecs and interceptors again for every peer
+	w.state.api = webrtc.NewAPI()
+
 	// Create shared video track
 	var err error
 	w.state.videoTrack, err = webrtc.NewTrackLocalStaticSample(
@@ -499,6 +549,14 @@ func (w *WebSink) Start(self *base.GstBaseSink) bool {
 		return false
 	}
 
+	// Generate the DTLS certificate up front so the first viewer does not wait for it;
+	// without a shared one every peer connection would generate its own key pair
+	w.state.certificate = nil
+	if _, err := w.dtlsCertificate(); err != nil {
+		self.Log(CAT, gst.LevelError, "Failed to generate DTLS certificate")
+		return false
+	}
+
 	// Start HTTP server
 	if !w.startHTTPServer(self) {
 		return false
@@ -546,7 +604,7 @@ func (w *WebSink) Render(self *base.GstBaseSink, buffer *gst.Buffer) gst.FlowRet
 
 	if w.settings.isLive {
 		if w.state.numPeers.Load() == 0 {
-			self.Log(CAT, gst.LevelDebug, "No clients connected")
+			// Dropped silently: logging here would run for every buffer
 			return gst.FlowOK
 		}
 	} else {
@@ -563,10 +621,19 @@ func (w *WebSink) Render(self *base.GstBaseSink, buffer *gst.Buffer) gst.FlowRet
 		}
 	}
 
-	samples := buffer.Map(gst.MapRead).Bytes()
+	mapInfo := buffer.Map(gst.MapRead)
+	if mapInfo == nil {
+		self.Log(CAT, gst.LevelError, "Failed to map buffer")
+		return gst.FlowError
+	}
 	defer buffer.Unmap()
 
-	if err := w.state.videoTrack.WriteSample(media.Sample{Data: samples, Duration: *buffer.Duration().AsDuration()}); err != nil {
+	duration := DefaultFrameDuration
+	if d := buffer.Duration().AsDuration(); d != nil {
+		duration = *d
+	}
+
+	if err := w.state.videoTrack.WriteSample(media.Sample{Data: mapInfo.Bytes(), Duration: duration}); err != nil {
 		self.Log(CAT, gst.LevelError, "Error writing sample to track")
 		return gst.FlowError
 	}
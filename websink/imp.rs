@@ -1,14 +1,15 @@
 use gst::glib;
 use gst::prelude::*;
 use gst::subclass::prelude::*;
+use gst_base::prelude::*;
 use gst_base::subclass::prelude::*;
 
-use std::sync::atomic::{ AtomicU32, Ordering };
+use std::sync::atomic::{ AtomicBool, AtomicU32, Ordering };
 use std::sync::{Arc, Mutex};
 use std::sync::LazyLock;
 use std::time::Duration;
 
-use tokio::runtime::Runtime;
+use tokio::runtime::{Builder, Runtime};
 use tokio::sync::mpsc;
 use webrtc::api::media_engine::MIME_TYPE_H264;
 use webrtc::ice_transport::ice_server::RTCIceServer;
@@ -34,6 +35,8 @@ pub static CAT: LazyLock<gst::DebugCategory> = LazyLock::new(|| {
 // Default values for properties
 const DEFAULT_PORT: u16 = 8091;
 const DEFAULT_STUN_SERVER: &str = "stun:stun.l.google.com:19302";
+// Number of samples that may be queued for the track writer before new ones are dropped
+const SAMPLE_QUEUE_SIZE: usize = 8;
 
 // Property value storage
 #[derive(Debug, Clone)]
@@ -61,6 +64,9 @@ pub struct WebSink {
     settings: Mutex<Settings>,
     state: Arc<Mutex<State>>,
     render_count: AtomicU32,
+    // Set after a dropped sample until the next keyframe is sent
+    waiting_for_keyframe: AtomicBool,
+    dropped_samples: AtomicU32,
 }
 
 // Default implementation for our element
@@ -70,6 +76,8 @@ impl Default for WebSink {
             settings: Mutex::new(Settings::default()),
             state: Arc::new(Mutex::new(State::default())),
             render_count: AtomicU32::new(0),
+            waiting_for_keyframe: AtomicBool::new(false),
+            dropped_samples: AtomicU32::new(0),
         }
     }
 }
@@ -201,9 +209,9 @@ impl BaseSinkImpl for WebSink {
     fn start(&self) -> Result<(), gst::ErrorMessage> {
         gst::info!(CAT, "🚀 Starting WebSink");
 
-        // Initialize Tokio runtime
+        // Initialize Tokio runtime, naming its threads so they can be told apart in profilers
         gst::debug!(CAT, "⚙️ Initializing Tokio runtime");
-        let runtime = match Runtime::new() {
+        let runtime = match Builder::new_multi_thread().thread_name("websink-rt").enable_all().build() {
             Ok(rt) => {
                 gst::info!(CAT, "✅ Tokio runtime created successfully");
                 rt
@@ -218,7 +226,7 @@ impl BaseSinkImpl for WebSink {
         let (tx, rx) = mpsc::channel(1);
         gst::info!(CAT, "📺 Created mpsc channel for live mode signaling");
 
-        gst::info!(CAT, "✅ WebRTC components will be initialized per session");
+        gst::info!(CAT, "✅ Peer connections will be created per session");
 
         // Create video track
         gst::debug!(CAT, "🎥 Creating video track for H.264");
@@ -232,6 +240,34 @@ impl BaseSinkImpl for WebSink {
         ));
         gst::info!(CAT, "✅ Video track created successfully");
 
+        // Single writer task that feeds the shared track in buffer order
+        let (sample_tx, mut sample_rx) = mpsc::channel::<Sample>(SAMPLE_QUEUE_SIZE);
+        let writer_track = Arc::clone(&video_track);
+        runtime.spawn(async move {
+            while let Some(sample) = sample_rx.recv().await {
+                if let Err(e) = writer_track.write_sample(&sample).await {
+                    gst::error!(CAT, "❌ Failed to write sample to WebRTC track: {}", e);
+                } else {
+                    gst::trace!(CAT, "✅ Successfully wrote sample to WebRTC track");
+                }
+            }
+            gst::debug!(CAT, "🎥 Sample writer task finished");
+        });
+        gst::info!(CAT, "✅ Sample writer task started");
+        self.waiting_for_keyframe.store(false, Ordering::Relaxed);
+        self.dropped_samples.store(0, Ordering::Relaxed);
+
+        // Build the WebRTC API once; sessions reuse it instead of registering
+        // codecs and interceptors on every connection
+        gst::debug!(CAT, "⚙️ Building WebRTC API");
+        let webrtc_api = match server::build_webrtc_api() {
+            Ok(api) => Arc::new(api),
+            Err(err) => {
+                gst::error!(CAT, "❌ Failed to build WebRTC API: {}", err);
+                return Err(gst::error_msg!(gst::ResourceError::Failed, ["Failed to build WebRTC API: {}", err]));
+            }
+        };
+
         // Configure WebRTC
         let settings = self.settings.lock().unwrap();
         let mut webrtc_config = RTCConfiguration::default();
@@ -252,12 +288,21 @@ impl BaseSinkImpl for WebSink {
         state.unblock_tx = Some(tx);
         state.unblock_rx = Some(rx);
         state.video_track = Some(video_track);
+        state.sample_tx = Some(sample_tx);
         state.webrtc_config = Some(webrtc_config);
+        state.webrtc_api = Some(webrtc_api);
 
         // Start HTTP server
         gst::info!(CAT, "🌐 Starting HTTP server on port {}", port);
         let rt = state.runtime.as_ref().expect("Runtime should be initialized");
-        let server_handle = self.start_http_server(port, rt);
+        let server_handle = match self.start_http_server(port, rt) {
+            Ok(handle) => handle,
+            Err(err) => {
+                gst::error!(CAT, "❌ Failed to start HTTP server on port {}: {}", port, err);
+                *state = State::default();
+                return Err(gst::error_msg!(gst::ResourceError::OpenReadWrite, ["Failed to start HTTP server on port {}: {}", port, err]));
+            }
+        };
 
         state.server_handle = Some(server_handle);
         gst::info!(CAT, "✅ WebSink started successfully");
@@ -292,7 +337,9 @@ impl BaseSinkImpl for WebSink {
         state.unblock_rx = None;
         state.runtime = None;
         state.video_track = None;
+        state.sample_tx = None;
         state.webrtc_config = None;
+        state.webrtc_api = None;
         gst::debug!(CAT, "🧹 Reset all state components");
 
         gst::debug!(CAT, "🔢 Peer connections cleared from state");
@@ -302,11 +349,11 @@ impl BaseSinkImpl for WebSink {
     }
 
     fn render(&self, buffer: &gst::Buffer) -> Result<gst::FlowSuccess, gst::FlowError> {
-        // Get the number of connected peers from state
-        let (num_peers, is_live) = {
+        // Get the number of connected peers and the sample sender from state in one go
+        let (num_peers, is_live, sample_tx) = {
             let state_guard = self.state.lock().unwrap();
             let settings_guard = self.settings.lock().unwrap();
-            (state_guard.peer_connections.len(), settings_guard.is_live)
+            (state_guard.peer_connections.len(), settings_guard.is_live, state_guard.sample_tx.clone())
         };
         let render_count = self.render_count.fetch_add(1, Ordering::Relaxed);
 
@@ -330,36 +377,51 @@ impl BaseSinkImpl for WebSink {
 
         // Send to video track if we have peers
         if num_peers > 0 {
-            let state = self.state.lock().unwrap();
-            if let Some(video_track) = &state.video_track {
-                let track_clone = Arc::clone(video_track);
-                let data_copy = bytes::Bytes::copy_from_slice(data);
+            if let Some(sample_tx) = sample_tx {
                 let duration = buffer.duration().unwrap_or_else(|| gst::ClockTime::from_nseconds(33_333_333)); // Default 30fps
 
                 if (render_count % 100) == 0 { gst::trace!(CAT, "⏱️ Buffer duration: {} ns", duration.nseconds()); }
 
-                // Use the runtime to send the sample
-                if let Some(runtime) = &state.runtime {
-                    runtime.spawn(async move {
-                        let sample = Sample {
-                            data: data_copy,
-                            duration: Duration::from_nanos(duration.nseconds()),
-                            ..Default::default()
-                        };
-
-                        gst::trace!(CAT, "🚀 Spawned async task to write sample to WebRTC track");
-
-                        if let Err(e) = track_clone.write_sample(&sample).await {
-                            gst::error!(CAT, "❌ Failed to write sample to WebRTC track: {}", e);
-                        } else {
-                            gst::trace!(CAT, "✅ Successfully wrote sample to WebRTC track");
+                // After a drop, delta frames reference data the peers never received;
+                // skip them until the next keyframe so decoders resync cleanly
+                if self.waiting_for_keyframe.load(Ordering::Relaxed) {
+                    if buffer.flags().contains(gst::BufferFlags::DELTA_UNIT) {
+                        gst::trace!(CAT, "⏭️ Waiting for keyframe, discarding delta frame");
+                        return Ok(gst::FlowSuccess::Ok);
+                    }
+                    self.waiting_for_keyframe.store(false, Ordering::Relaxed);
+                    gst::info!(CAT, "🔑 Keyframe received, resuming after dropped samples");
+                }
+
+                let sample = Sample {
+                    // Copied: RTP packets built from the sample are kept by the NACK
+                    // responder, which would otherwise pin upstream pool buffers
+                    data: bytes::Bytes::copy_from_slice(data),
+                    duration: Duration::from_nanos(duration.nseconds()),
+                    ..Default::default()
+                };
+
+                // Hand the sample to the writer task without blocking the streaming thread.
+                // If the writer has fallen behind the sample is dropped and the stream
+                // resumes from the next keyframe, which is requested from upstream.
+                match sample_tx.try_send(sample) {
+                    Ok(()) => {}
+                    Err(mpsc::error::TrySendError::Full(_)) => {
+                        let dropped = self.dropped_samples.fetch_add(1, Ordering::Relaxed) + 1;
+                        // Later deltas are skipped without reaching the queue, so this runs
+                        // once per drop episode
+                        if !self.waiting_for_keyframe.swap(true, Ordering::Relaxed) {
+                            gst::warning!(CAT, "⚠️ Sample queue full, dropped sample ({} in total); waiting for a keyframe", dropped);
+                            self.request_keyframe();
                         }
-                    });
-                } else {
-                    gst::error!(CAT, "❌ No Tokio runtime available for async sample writing");
+                    }
+                    Err(mpsc::error::TrySendError::Closed(_)) => {
+                        gst::element_imp_error!(self, gst::StreamError::Failed, ["Sample writer task is not running"]);
+                        return Err(gst::FlowError::Error);
+                    }
                 }
             } else {
-                gst::warning!(CAT, "⚠️ No video track available for sample writing");
+                gst::warning!(CAT, "⚠️ No sample writer available, not sending video data");
             }
         } else {
             gst::trace!(CAT, "👥 No peers connected, not sending video data");
@@ -371,7 +433,17 @@ impl BaseSinkImpl for WebSink {
 }
 
 impl WebSink {
-    fn start_http_server(&self, port: u16, rt: &Runtime) -> tokio::task::JoinHandle<()> {
+    // Ask upstream for a keyframe so peers can resync after dropped samples
+    fn request_keyframe(&self) {
+        let event = gst_video::UpstreamForceKeyUnitEvent::builder()
+            .all_headers(true)
+            .build();
+        if !self.obj().sink_pad().push_event(event) {
+            gst::debug!(CAT, "🔑 Upstream did not handle the keyframe request");
+        }
+    }
+
+    fn start_http_server(&self, port: u16, rt: &Runtime) -> Result<tokio::task::JoinHandle<()>, warp::Error> {
         gst::info!(CAT, "Starting HTTP server on port {}", port);
 
         // Clone the state Arc to move into the async block
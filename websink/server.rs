@@ -13,13 +13,14 @@ use get_if_addrs::get_if_addrs;
 // WebRTC imports
 use webrtc::api::interceptor_registry::register_default_interceptors;
 use webrtc::api::media_engine::{MediaEngine};
-use webrtc::api::APIBuilder;
+use webrtc::api::{APIBuilder, API};
 use webrtc::interceptor::registry::Registry;
 use webrtc::peer_connection::configuration::RTCConfiguration;
 use webrtc::peer_connection::peer_connection_state::RTCPeerConnectionState;
 use webrtc::peer_connection::sdp::session_description::RTCSessionDescription;
 use webrtc::track::track_local::track_local_static_sample::TrackLocalStaticSample;
 use webrtc::track::track_local::TrackLocal;
+use webrtc::media::Sample;
 
 // Color codes for terminal output
 const GREEN: &str = "\x1b[32m";
@@ -55,7 +56,9 @@ pub struct State {
     pub unblock_rx: Option<mpsc::Receiver<i32>>,
     // WebRTC components
     pub video_track: Option<Arc<TrackLocalStaticSample>>,
+    pub sample_tx: Option<mpsc::Sender<Sample>>,
     pub webrtc_config: Option<RTCConfiguration>,
+    pub webrtc_api: Option<Arc<API>>,
 }
 
 // Custom errors for error handling
@@ -67,6 +70,21 @@ impl warp::reject::Reject for SessionError {}
 pub struct ServeError;
 impl warp::reject::Reject for ServeError {}
 
+// Build the WebRTC API shared by all sessions. Each peer connection gets its own
+// copy of the media engine and fresh interceptors, so the API itself can be reused.
+pub fn build_webrtc_api() -> webrtc::error::Result<API> {
+    let mut m = MediaEngine::default();
+    m.register_default_codecs()?;
+
+    let mut registry = Registry::new();
+    registry = register_default_interceptors(registry, &mut m)?;
+
+    Ok(APIBuilder::new()
+        .with_media_engine(m)
+        .with_interceptor_registry(registry)
+        .build())
+}
+
 // Handle WebRTC session request (create peer connection and answer)
 pub async fn handle_session_request(
     req: SessionRequest,
@@ -74,28 +92,18 @@ pub async fn handle_session_request(
 ) -> Result<SessionResponse, Box<dyn std::error::Error + Send + Sync>> {
     gst::info!(CAT, "🎯 Processing WebRTC session request");
 
-    // Get the shared video track and config from state
-    let (webrtc_config, video_track) = {
+    // Get the shared video track, config and API from state
+    let (webrtc_config, video_track, api) = {
         let state_guard = state.lock().unwrap();
         let config = state_guard.webrtc_config.clone()
             .ok_or("WebRTC config not initialized")?;
         let track = state_guard.video_track.clone()
             .ok_or("Video track not initialized")?;
-        (config, track)
+        let api = state_guard.webrtc_api.clone()
+            .ok_or("WebRTC API not initialized")?;
+        (config, track, api)
     };
 
-    // Create a new MediaEngine and API for this session
-    let mut m = MediaEngine::default();
-    m.register_default_codecs()?;
-
-    let mut registry = Registry::new();
-    registry = register_default_interceptors(registry, &mut m)?;
-
-    let api = APIBuilder::new()
-        .with_media_engine(m)
-        .with_interceptor_registry(registry)
-        .build();
-
     // Create a new peer connection using the API and shared config
     let peer_connection = Arc::new(api.new_peer_connection(webrtc_config).await?);
     gst::info!(CAT, "📞 Created new peer connection");
@@ -187,7 +195,66 @@ pub async fn handle_session_request(
     Ok(response)
 }
 
-pub fn start_http_server(state: Arc<Mutex<State>>, port: u16, rt: &Runtime) -> tokio::task::JoinHandle<()> {
+pub fn start_http_server(state: Arc<Mutex<State>>, port: u16, rt: &Runtime) -> Result<tokio::task::JoinHandle<()>, warp::Error> {
+    // API session handler - now with actual WebRTC signaling
+    let api_session = warp::path!("api" / "session")
+        .and(warp::post())
+        .and(warp::body::json())
+        .and(warp::any().map(move || Arc::clone(&state)))
+        .and_then(|body: SessionRequest, state: Arc<Mutex<State>>| async move {
+            gst::info!(CAT, "🔗 Received WebRTC session request");
+            gst::debug!(CAT, "📨 Session request body: {:?}", body);
+
+            match handle_session_request(body, state).await {
+                Ok(response) => {
+                    gst::info!(CAT, "✅ Successfully handled WebRTC session request");
+                    Ok(warp::reply::json(&response))
+                },
+                Err(e) => {
+                    gst::error!(CAT, "❌ Failed to handle WebRTC session request: {}", e);
+                    Err(warp::reject::custom(SessionError()))
+                }
+            }
+        });
+
+    let static_assets = warp::path::tail().and_then(|tail: warp::path::Tail| async move {
+        let path = tail.as_str();
+        let path_to_serve = if path.is_empty() || path == "/" {
+            "index.html"
+        } else {
+            path
+        };
+
+        gst::debug!(CAT, "🌐 Static asset request for: {}", path_to_serve);
+
+        match Asset::get(path_to_serve) {
+            Some(content) => {
+                let mime = mime_guess::from_path(path_to_serve).first_or_octet_stream();
+                let body: Cow<'static, [u8]> = content.data;
+                gst::debug!(CAT, "✅ Serving static asset: {} ({} bytes, mime: {})",
+                           path_to_serve, body.len(), mime.as_ref());
+                let response = warp::http::Response::builder()
+                    .header("Content-Type", mime.as_ref())
+                    .body(body)
+                    .map_err(|_| warp::reject::custom(ServeError))?;
+                Ok(response)
+            }
+            None => {
+                gst::warning!(CAT, "❌ Static asset not found: {}", path_to_serve);
+                Err(warp::reject::not_found())
+            }
+        }
+    });
+
+    let routes = api_session.or(static_assets);
+
+    // Bind before returning so the server is ready, and bind errors are reported,
+    // by the time the element has started
+    let (addr, server) = {
+        let _guard = rt.enter();
+        warp::serve(routes).try_bind_ephemeral(([0, 0, 0, 0], port))?
+    };
+
     // Print all relevant addresses as in Go version
     let hostname = get_hostname().ok().and_then(|h| h.into_string().ok()).unwrap_or_else(|| "localhost".to_string());
     let mut external_ip = None;
@@ -202,7 +269,7 @@ pub fn start_http_server(state: Arc<Mutex<State>>, port: u16, rt: &Runtime) -> t
             }
         }
     }
-    let port_str = port.to_string();
+    let port_str = addr.port().to_string();
     let ext_ip = external_ip.unwrap_or_else(|| "localhost".to_string());
     println!(
         "{green}HTTP server started at http://{host}.local:{port} and http://{ip}:{port}{reset}",
@@ -212,62 +279,10 @@ pub fn start_http_server(state: Arc<Mutex<State>>, port: u16, rt: &Runtime) -> t
         ip=ext_ip,
         reset=RESET
     );
-    gst::info!(CAT, "HTTP server starting on http://0.0.0.0:{}", port);
-
-    rt.spawn(async move {
-        // API session handler - now with actual WebRTC signaling
-        let api_session = warp::path!("api" / "session")
-            .and(warp::post())
-            .and(warp::body::json())
-            .and(warp::any().map(move || Arc::clone(&state)))
-            .and_then(|body: SessionRequest, state: Arc<Mutex<State>>| async move {
-                gst::info!(CAT, "🔗 Received WebRTC session request");
-                gst::debug!(CAT, "📨 Session request body: {:?}", body);
-
-                match handle_session_request(body, state).await {
-                    Ok(response) => {
-                        gst::info!(CAT, "✅ Successfully handled WebRTC session request");
-                        Ok(warp::reply::json(&response))
-                    },
-                    Err(e) => {
-                        gst::error!(CAT, "❌ Failed to handle WebRTC session request: {}", e);
-                        Err(warp::reject::custom(SessionError()))
-                    }
-                }
-            });
-
-        let static_assets = warp::path::tail().and_then(|tail: warp::path::Tail| async move {
-            let path = tail.as_str();
-            let path_to_serve = if path.is_empty() || path == "/" {
-                "index.html"
-            } else {
-                path
-            };
-
-            gst::debug!(CAT, "🌐 Static asset request for: {}", path_to_serve);
-
-            match Asset::get(path_to_serve) {
-                Some(content) => {
-                    let mime = mime_guess::from_path(path_to_serve).first_or_octet_stream();
-                    let body: Cow<'static, [u8]> = content.data;
-                    gst::debug!(CAT, "✅ Serving static asset: {} ({} bytes, mime: {})",
-                               path_to_serve, body.len(), mime.as_ref());
-                    let response = warp::http::Response::builder()
-                        .header("Content-Type", mime.as_ref())
-                        .body(body)
-                        .map_err(|_| warp::reject::custom(ServeError))?;
-                    Ok(response)
-                }
-                None => {
-                    gst::warning!(CAT, "❌ Static asset not found: {}", path_to_serve);
-                    Err(warp::reject::not_found())
-                }
-            }
-        });
-
-        let routes = api_session.or(static_assets);
+    gst::info!(CAT, "HTTP server listening on http://{}", addr);
 
-        warp::serve(routes).run(([0, 0, 0, 0], port)).await;
-        gst::info!(CAT, "HTTP server on port {} stopped.", port);
-    })
+    Ok(rt.spawn(async move {
+        server.await;
+        gst::info!(CAT, "HTTP server on port {} stopped.", addr.port());
+    }))
 }